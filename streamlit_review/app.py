@@ -6,16 +6,42 @@ New sample/annotations files are generated; old ones (sample_old.json, annotatio
 """
 from __future__ import annotations
 
-import bz2
+import hashlib
+import io
 import json
 import os
-import tempfile
+import pickle
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, List, NamedTuple, Sequence, Tuple
 
+import numpy as np
 import pandas as pd
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
 import streamlit as st
 
+import build_ad_text_store as text_store
+
+try:  # optional: several times faster than the stdlib json module
+    import orjson
+except ImportError:
+    orjson = None
+
+try:  # optional: persistent cache for the filtered ad texts
+    import diskcache
+except ImportError:
+    diskcache = None
+
+try:  # optional: zstd-compressed sample file
+    import zstandard
+except ImportError:
+    zstandard = None
+# What reading a malformed (rather than unreadable) sample file raises.
+_SAMPLE_DECODE_ERRORS = (ValueError, zstandard.ZstdError) if zstandard is not None else (ValueError,)
+
 
 ROOT = Path(__file__).resolve().parent.parent
 RESULTS_DIR = ROOT / "Results Datasets" / "ai_mentions" / "results" / "requirements"
@@ -23,16 +49,71 @@ RESULTS_V6 = RESULTS_DIR / "v6"
 RESULTS_V7 = RESULTS_DIR / "v7"
 RESULTS_V7_RERUN = RESULTS_DIR / "v7_rerun" / "ai_job_requirements_all_2010_2024_v7_rerun.json"
 RESULTS_V7_RERUN2 = RESULTS_DIR / "v7_rerun2" / "ai_job_requirements_all_2010_2024_v7_rerun2.json"
+# Written by migrate_results_to_parquet.py; used instead of the JSON when newer.
+RESULTS_PARQUET_DIR = RESULTS_DIR / "parquet"
 TEXT_DIR = ROOT / "Base Dataset" / "Data" / "699_SJMM_Data_TextualData_v10.0" / "sjmm_suf_ad_texts"
 DATA_DIR = Path(__file__).resolve().parent / "data"
-SAMPLE_PATH = DATA_DIR / "sample.json"
+SAMPLE_PATH = DATA_DIR / "sample.jsonl"
+# Written instead of SAMPLE_PATH when zstandard is installed.
+SAMPLE_ZST_PATH = DATA_DIR / "sample.jsonl.zst"
+# Indented single-document format used before sample.jsonl; still read once.
+LEGACY_SAMPLE_PATH = DATA_DIR / "sample.json"
 ANNOTATIONS_PATH = DATA_DIR / "annotations.json"
+# Append-only log of edits since annotations.json was last rewritten.
+ANNOTATIONS_LOG_PATH = DATA_DIR / "annotations.log.jsonl"
+# Seconds after the last edit before the log is folded into annotations.json.
+ANNOTATIONS_FLUSH_DELAY = 2.0
+# Built by build_ad_text_store.py, or by the app through the same module
+# whenever it is missing or was built from a different set of archives.
+TEXT_STORE_PATH = DATA_DIR / "ad_texts.parquet"
+# Filtered texts of the last sample build, kept across restarts (diskcache).
+TEXT_CACHE_DIR = DATA_DIR / "_textcache"
 
 BUCKETS: List[Tuple[str, int, int]] = [
     ("recent", 2020, 2024),
     ("mid", 2015, 2019),
     ("early", 2010, 2014),
 ]
+# Normalised LLM labels. Interned so every row shares the same three string
+# objects; anything that is not true/maybe (case-insensitive) counts as False.
+LABEL_TRUE = sys.intern("True")
+LABEL_MAYBE = sys.intern("Maybe")
+LABEL_FALSE = sys.intern("False")
+_LABEL_NORM: Dict[str, str] = {"true": LABEL_TRUE, "maybe": LABEL_MAYBE}
+# Spellings the LLM actually returns, resolved with a single lookup.
+_LABEL_EXACT: Dict[str, str] = {
+    spelling: label
+    for word, label in (("true", LABEL_TRUE), ("maybe", LABEL_MAYBE), ("false", LABEL_FALSE))
+    for spelling in (word, word.capitalize(), word.upper())
+}
+LABEL_DTYPE = pd.CategoricalDtype([LABEL_TRUE, LABEL_MAYBE, LABEL_FALSE])
+_TRUE_CODE = LABEL_DTYPE.categories.get_loc(LABEL_TRUE)
+VERSIONS = ("v6", "v7", "v7_rerun", "v7_rerun2")
+LABEL_COLUMNS = [f"label_{v}" for v in VERSIONS]
+
+
+class AdRec(NamedTuple):
+    """One classified ad from a results file, label already normalised."""
+
+    label: str
+    reason: str
+    keywords: Sequence[str]
+
+# Bump when the shape of pickled results changes so stale sidecars are ignored.
+_CACHE_FORMAT = 2
+
+# Result files per version: (directory, glob pattern).
+RESULT_SOURCES: Dict[str, Tuple[Path, str]] = {
+    "v6": (RESULTS_V6, "ai_job_requirements_all_*_v6.json"),
+    "v7": (RESULTS_V7, "ai_job_requirements_all_*_v7.json"),
+    "v7_rerun": (RESULTS_V7_RERUN.parent, RESULTS_V7_RERUN.name),
+    "v7_rerun2": (RESULTS_V7_RERUN2.parent, RESULTS_V7_RERUN2.name),
+}
+
+_BUCKET_SPANS = sorted(BUCKETS, key=lambda b: b[1])
+_BUCKET_NAMES = np.array([name for name, _, _ in _BUCKET_SPANS], dtype=object)
+_BUCKET_STARTS = np.array([start for _, start, _ in _BUCKET_SPANS])
+_BUCKET_ENDS = np.array([end for _, _, end in _BUCKET_SPANS])
 
 def _current_index_state(n: int) -> int:
     if "idx" not in st.session_state:
@@ -41,314 +122,605 @@ def _current_index_state(n: int) -> int:
     return st.session_state.idx
 
 
-@st.cache_data(show_spinner=False)
-def _load_results_all_v6() -> Dict[int, Dict[str, dict]]:
-    res: Dict[int, Dict[str, dict]] = {}
-    if not RESULTS_V6.exists():
-        return res
-    for path in sorted(RESULTS_V6.glob("ai_job_requirements_all_*_v6.json")):
+Signature = Tuple[Tuple[str, int, int], ...]
+
+
+def _json_loads(data: bytes):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+def _json_dumps_line(obj) -> bytes:
+    """Compact single-line JSON terminated by a newline (JSONL)."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE)
+    return json.dumps(obj, ensure_ascii=False).encode("utf-8") + b"\n"
+
+
+def _json_dumps(obj) -> bytes:
+    """Indented UTF-8 JSON, the on-disk format of sample.json/annotations.json."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+
+
+def _files_signature(paths) -> Signature:
+    """(path, mtime_ns, size) per existing file; changes whenever any input file does."""
+    sig = []
+    for p in paths:
         try:
-            data = json.loads(path.read_text(encoding="utf-8"))
-        except Exception:
+            stat = p.stat()
+        except OSError:
             continue
-        for ys, ads in data.items():
-            try:
-                yi = int(ys)
-            except Exception:
-                continue
-            if isinstance(ads, dict):
-                res.setdefault(yi, {}).update(ads)
-    return res
+        sig.append((str(p), stat.st_mtime_ns, stat.st_size))
+    return tuple(sig)
 
 
-@st.cache_data(show_spinner=False)
-def _load_results_v7() -> Dict[int, Dict[str, dict]]:
-    res: Dict[int, Dict[str, dict]] = {}
-    if not RESULTS_V7.exists():
-        return res
-    for path in sorted(RESULTS_V7.glob("ai_job_requirements_all_*_v7.json")):
+def _results_signature(version: str) -> Signature:
+    directory, pattern = RESULT_SOURCES[version]
+    return _files_signature(sorted(directory.glob(pattern)))
+
+
+def _parquet_signature(version: str) -> Signature:
+    return _files_signature(sorted((RESULTS_PARQUET_DIR / f"version={version}").rglob("*.parquet")))
+
+
+def _pickled(name: str, sig: Signature, build):
+    """
+    Return build(), reusing DATA_DIR/_{name}.pkl when it was written for the same
+    signature. Lets a cold start skip re-parsing inputs that have not changed.
+    """
+    path = DATA_DIR / f"_{name}.pkl"
+    if path.exists():
         try:
-            data = json.loads(path.read_text(encoding="utf-8"))
+            with path.open("rb") as fh:
+                cached_key, value = pickle.load(fh)
+            if cached_key == (_CACHE_FORMAT, sig):
+                return value
         except Exception:
-            continue
+            pass
+    value = build()
+    try:
+        DATA_DIR.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".pkl.tmp")
+        with tmp.open("wb") as fh:
+            pickle.dump(((_CACHE_FORMAT, sig), value), fh, protocol=pickle.HIGHEST_PROTOCOL)
+        tmp.replace(path)
+    except Exception:
+        pass
+    return value
+
+
+def _map_files(fn, paths: List[Path]) -> list:
+    """
+    Apply fn to independent input files on a thread pool; results keep input
+    order. Threads rather than processes: Streamlit executes this script as a
+    synthetic __main__, so workers could not be re-imported under spawn, and
+    file reads release the GIL anyway.
+    """
+    if len(paths) <= 1:
+        return [fn(p) for p in paths]
+    with ThreadPoolExecutor(max_workers=min(len(paths), os.cpu_count() or 1)) as ex:
+        return list(ex.map(fn, paths))
+
+
+def _label(meta: dict) -> str:
+    raw = meta.get("ai_requirement")
+    try:
+        return _LABEL_EXACT[raw]
+    except (KeyError, TypeError):
+        pass
+    return _LABEL_NORM.get(str(raw).lower() if raw else "", LABEL_FALSE)
+
+
+def _ad_rec(meta: dict) -> AdRec:
+    return AdRec(_label(meta), meta.get("reason", ""), meta.get("keywords", []))
+
+
+def _read_results_file(path: Path) -> dict:
+    try:
+        return _json_loads(path.read_bytes())
+    except Exception:
+        return {}
+
+
+def _parse_results(sig: Signature) -> Dict[int, Dict[str, AdRec]]:
+    """
+    Merge result files into {year: {ad_id: AdRec}}. Each ad's raw dict is reduced
+    to a compact typed record at parse time instead of being kept around.
+    """
+    res: Dict[int, Dict[str, AdRec]] = {}
+    for data in _map_files(_read_results_file, [Path(name) for name, _, _ in sig]):
         for ys, ads in data.items():
             try:
                 yi = int(ys)
             except Exception:
                 continue
             if isinstance(ads, dict):
-                res.setdefault(yi, {}).update(ads)
+                res.setdefault(yi, {}).update(
+                    (ad_id, _ad_rec(meta)) for ad_id, meta in ads.items() if isinstance(meta, dict)
+                )
     return res
 
 
-@st.cache_data(show_spinner=False)
-def _load_results_v7_rerun() -> Dict[int, Dict[str, dict]]:
-    rerun: Dict[int, Dict[str, dict]] = {}
-    if not RESULTS_V7_RERUN.exists():
-        return rerun
-    try:
-        data = json.loads(RESULTS_V7_RERUN.read_text(encoding="utf-8"))
-    except Exception:
-        return rerun
-    for ys, ads in data.items():
-        try:
-            yi = int(ys)
-        except Exception:
-            continue
-        if isinstance(ads, dict):
-            rerun.setdefault(yi, {}).update(ads)
-    return rerun
+def _read_results_parquet(version: str) -> Dict[int, Dict[str, AdRec]]:
+    table = ds.dataset(RESULTS_PARQUET_DIR, format="parquet", partitioning="hive").to_table(
+        columns=["year", "ad_id", "ai_requirement", "reason", "keywords"],
+        filter=ds.field("version") == version,
+    )
+    res: Dict[int, Dict[str, AdRec]] = {}
+    for year, ad_id, raw, reason, keywords in zip(*(col.to_pylist() for col in table.columns)):
+        rec = AdRec(_label({"ai_requirement": raw}), reason, keywords or [])
+        res.setdefault(int(year), {})[ad_id] = rec
+    return res
 
 
-@st.cache_data(show_spinner=False)
-def _load_results_v7_rerun2() -> Dict[int, Dict[str, dict]]:
-    rerun: Dict[int, Dict[str, dict]] = {}
-    if not RESULTS_V7_RERUN2.exists():
-        return rerun
-    try:
-        data = json.loads(RESULTS_V7_RERUN2.read_text(encoding="utf-8"))
-    except Exception:
-        return rerun
-    for ys, ads in data.items():
+def _read_results(version: str, sig: Signature, parquet_sig: Signature) -> Dict[int, Dict[str, AdRec]]:
+    """
+    {year: {ad_id: AdRec}} for one result version. Scans the Parquet dataset when
+    it is at least as new as the JSON files, otherwise parses the JSON (through
+    the pickled sidecar).
+    """
+    if parquet_sig and max(m for _, m, _ in parquet_sig) >= max((m for _, m, _ in sig), default=0):
         try:
-            yi = int(ys)
+            return _read_results_parquet(version)
         except Exception:
-            continue
-        if isinstance(ads, dict):
-            rerun.setdefault(yi, {}).update(ads)
-    return rerun
+            pass
+    return _pickled(f"results_{version}", sig, lambda: _parse_results(sig))
 
 
-@st.cache_data(show_spinner=False)
-def _load_texts(years: List[int]) -> Dict[str, str]:
-    texts: Dict[str, str] = {}
-    for year in sorted(set(years)):
-        p = TEXT_DIR / f"ads_sjmm_{year}.jsonl.bz2"
-        if not p.exists():
-            continue
+def _results_signatures() -> Tuple[Tuple[Signature, Signature], ...]:
+    """(JSON signature, Parquet signature) per entry of VERSIONS."""
+    return tuple((_results_signature(v), _parquet_signature(v)) for v in VERSIONS)
+
+
+@st.cache_resource(show_spinner=False)
+def _load_all_versions(sigs: Tuple[Tuple[Signature, Signature], ...]) -> Dict[str, Dict[int, Dict[str, AdRec]]]:
+    """
+    Results of every version in one cache entry; the versions are read
+    concurrently so their file reads overlap. Shared, not copied, between
+    callers (cache_resource): treat it as read-only.
+    """
+    jobs = [(version, sig, parquet_sig) for version, (sig, parquet_sig) in zip(VERSIONS, sigs)]
+    with ThreadPoolExecutor(max_workers=len(jobs)) as ex:
+        loaded = list(ex.map(lambda job: _read_results(*job), jobs))
+    return dict(zip(VERSIONS, loaded))
+
+
+def _candidate_ids(*sources: Dict[int, Dict[str, AdRec]]) -> List[str]:
+    """
+    ad_ids marked True/Maybe by at least one of the given sources, i.e. the only
+    ads that can enter the sample (and therefore the only texts worth loading).
+    """
+    ids = set()
+    for src in sources:
+        for ads in src.values():
+            ids.update(ad_id for ad_id, rec in ads.items() if rec.label != LABEL_FALSE)
+    return sorted(ids)
+
+
+def _text_store_fresh(archives: Dict[int, Path]) -> bool:
+    """
+    True when the store was built from exactly these archives. Compares the
+    recorded archive signature rather than mtimes, so an archive copied in
+    with an older preserved mtime still triggers a rebuild.
+    """
+    return text_store.store_signature(TEXT_STORE_PATH) == text_store.archive_signature(archives)
+
+
+def _read_texts(years: List[int], ad_ids: List[str], archives: Dict[int, Path]) -> Dict[str, str]:
+    """
+    Texts for the given ad_ids only; the full corpus never has to sit in memory
+    once the Parquet store exists. The first start (or one after an archive
+    changed) parses every archive once, a year at a time, and writes the store
+    for later runs.
+    """
+    wanted = set(ad_ids)
+    if _text_store_fresh(archives):
         try:
-            with bz2.open(p, "rt", encoding="utf-8") as fh:
-                for line in fh:
-                    try:
-                        obj = json.loads(line)
-                    except Exception:
-                        continue
-                    ad_id = obj.get("adve_iden_adve")
-                    txt = obj.get("adve_text_adve") or ""
-                    if isinstance(ad_id, str) and isinstance(txt, str) and txt.strip():
-                        texts[ad_id] = txt
+            table = pq.read_table(
+                TEXT_STORE_PATH,
+                columns=["ad_id", "text"],
+                filters=[("year", "in", sorted(set(years))), ("ad_id", "in", list(wanted))],
+            )
+            return dict(zip(table.column("ad_id").to_pylist(), table.column("text").to_pylist()))
         except Exception:
-            continue
+            pass
+
+    # Archives are decoded in parallel (read_years) and written in year order,
+    # keeping only the wanted texts once a year has been written.
+    try:
+        return text_store.write_store(archives, TEXT_STORE_PATH, keep=wanted, keep_years=set(years))
+    except OSError:
+        pass  # store not writable: read the requested years without it
+    texts: Dict[str, str] = {}
+    for _, ids, txts in text_store.read_years({y: archives[y] for y in sorted(set(years) & archives.keys())}):
+        texts.update((ad_id, txt) for ad_id, txt in zip(ids, txts) if ad_id in wanted)
     return texts
 
 
-@st.cache_data(show_spinner=False)
-def _load_sample(df: pd.DataFrame) -> List[dict]:
+@st.cache_resource(show_spinner=False)
+def _load_texts(years: List[int], ad_ids: List[str]) -> Dict[str, str]:
+    """
+    _read_texts, persisted across server restarts and keyed on the requested
+    years/ids and the archive mtimes, so it is invalidated by any archive change.
+    Without diskcache the result goes to a pickled sidecar instead. Shared, not
+    copied, between callers (cache_resource): treat it as read-only.
+    """
+    archives = text_store.archives(TEXT_DIR)
+    key = (sorted(set(years)), _files_signature(archives.values()), ad_ids)
+    if diskcache is None:
+        return _pickled("texts", key, lambda: _read_texts(years, ad_ids, archives))
+
+    digest = hashlib.blake2b(repr((_CACHE_FORMAT, key)).encode()).hexdigest()
+    try:
+        with diskcache.Cache(str(TEXT_CACHE_DIR), disk_pickle_protocol=pickle.HIGHEST_PROTOCOL) as cache:
+            texts = cache.get(digest)
+            if texts is None:
+                texts = _read_texts(years, ad_ids, archives)
+                # Only the latest build is ever read again.
+                cache.evict("texts")
+                cache.set(digest, texts, expire=None, tag="texts")
+            return texts
+    except Exception:
+        return _read_texts(years, ad_ids, archives)
+
+
+def _sample_paths() -> List[Path]:
+    """Sample files in the order they are read; the first one is written."""
+    return [SAMPLE_ZST_PATH, SAMPLE_PATH] if zstandard is not None else [SAMPLE_PATH]
+
+
+def _open_sample(path: Path, mode: str):
+    if path.suffix != ".zst":
+        return path.open(mode)
+    fh = zstandard.open(path, mode)
+    # The zstd reader has no readline, so it cannot be iterated line by line.
+    return io.BufferedReader(fh) if "r" in mode else fh
+
+
+def _write_sample(sample: List[dict]) -> None:
+    """One compact JSON object per line; no indentation to build or parse."""
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    with _open_sample(_sample_paths()[0], "wb") as fh:
+        fh.write(b"".join(_json_dumps_line(row) for row in sample))
+
+
+def _read_sample() -> List[dict] | None:
     def _valid(sample_obj: List[dict]) -> bool:
         if not isinstance(sample_obj, list) or not sample_obj:
             return False
         required = {"ad_id", "year", "text"}
         return required.issubset(set(sample_obj[0].keys()))
 
-    if SAMPLE_PATH.exists():
+    # Only malformed content falls through to a fresh sample; a read or write
+    # error propagates rather than letting the caller overwrite a good sample.
+    for path in _sample_paths():
+        if not path.exists():
+            continue
         try:
-            loaded = json.loads(SAMPLE_PATH.read_text(encoding="utf-8"))
-            if _valid(loaded):
-                return loaded
-        except Exception:
-            pass
+            with _open_sample(path, "rb") as fh:
+                loaded = [_json_loads(line) for line in fh if line.strip()]
+        except _SAMPLE_DECODE_ERRORS:
+            continue
+        if _valid(loaded):
+            return loaded
+    if LEGACY_SAMPLE_PATH.exists():
+        try:
+            loaded = _json_loads(LEGACY_SAMPLE_PATH.read_bytes())
+        except ValueError:
+            return None
+        if _valid(loaded):
+            _write_sample(loaded)
+            return loaded
+    return None
+
+
+def _load_sample(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Saved sample (with fields added since it was written), or all of df written
+    as the new sample. A fresh sample goes straight from the frame to JSONL; no
+    per-row dicts are built on that path.
+    """
+    loaded = _read_sample()
+    if loaded is not None:
+        return _sample_frame(loaded, df)
 
-    sample = df.to_dict(orient="records")
     DATA_DIR.mkdir(parents=True, exist_ok=True)
-    SAMPLE_PATH.write_text(json.dumps(sample, ensure_ascii=False, indent=2), encoding="utf-8")
-    return sample
+    # Compression is inferred from the suffix (zstd for SAMPLE_ZST_PATH).
+    df.to_json(_sample_paths()[0], orient="records", lines=True, force_ascii=False)
+    return df
 
 
-def _migrate_sample_fields(sample: List[dict], records_by_id: Dict[str, dict]) -> None:
+@st.cache_data(show_spinner=False)
+def _build_sample(sigs: Tuple[Tuple[Signature, Signature], ...]) -> pd.DataFrame | None:
     """
-    Ensure new fields (e.g., v7_rerun2, true_votes_v7_runs) exist on rows loaded
-    from an older sample.json. Does not change existing annotations.
+    Candidates, records and the sample for the given result signatures, built
+    once per server rather than per session; each session gets its own copy.
+    None when there are no results, an empty frame when no record has text.
     """
-    for row in sample:
-        src = records_by_id.get(row.get("ad_id"))
-        if not src:
-            continue
-        # Populate missing label/reason/keywords for v7_rerun2
-        if "label_v7_rerun2" not in row:
-            row["label_v7_rerun2"] = src.get("label_v7_rerun2", "False")
-        if "reason_v7_rerun2" not in row:
-            row["reason_v7_rerun2"] = src.get("reason_v7_rerun2", "")
-        if "keywords_v7_rerun2" not in row:
-            row["keywords_v7_rerun2"] = src.get("keywords_v7_rerun2", [])
-        # Recompute vote count if missing
-        if "true_votes_v7_runs" not in row:
-            row["true_votes_v7_runs"] = sum(
-                int(lbl == "True")
-                for lbl in (
-                    row.get("label_v7"),
-                    row.get("label_v7_rerun"),
-                    row.get("label_v7_rerun2"),
-                )
-            )
-        # Recompute agreement if missing
-        if "agreement_v7_runs" not in row:
-            l1 = row.get("label_v7")
-            l2 = row.get("label_v7_rerun")
-            l3 = row.get("label_v7_rerun2")
-            if l1 == l2 == l3:
-                row["agreement_v7_runs"] = 3
-            elif l1 == l2 or l1 == l3 or l2 == l3:
-                row["agreement_v7_runs"] = 2
-            else:
-                row["agreement_v7_runs"] = 0
-
-
-def _load_annotations() -> Dict[str, dict]:
+    results = _load_all_versions(sigs)
+    if not any(results.values()):
+        return None
+
+    years = sorted(set().union(*results.values()))
+    wanted = _candidate_ids(results["v6"], results["v7"], results["v7_rerun"])
+    texts = _load_texts(years, wanted)
+
+    df = _build_records(results, texts)
+    if df.empty:
+        return df
+
+    sample_df = _load_sample(df)
+    _refresh_flags(sample_df)
+    return sample_df
+
+
+def _migrate_sample_fields(sample_df: pd.DataFrame, df: pd.DataFrame) -> None:
+    """
+    Ensure new fields (e.g., v7_rerun2, true_votes_v7_runs) exist on a sample
+    loaded from an older sample file, one column at a time. Also makes the
+    label columns categorical. Does not change existing annotations.
+    """
+    src = df.drop_duplicates("ad_id", keep="last").set_index("ad_id")
+    # Populate missing label/reason/keywords for v7_rerun2
+    for col in ("label_v7_rerun2", "reason_v7_rerun2", "keywords_v7_rerun2"):
+        if col not in sample_df:
+            sample_df[col] = sample_df["ad_id"].map(src[col])
+    sample_df[LABEL_COLUMNS] = sample_df[LABEL_COLUMNS].astype(LABEL_DTYPE)
+    # Recompute vote count / agreement if missing
+    if "true_votes_v7_runs" not in sample_df or "agreement_v7_runs" not in sample_df:
+        votes, agreement = _v7_run_stats(sample_df)
+        if "true_votes_v7_runs" not in sample_df:
+            sample_df["true_votes_v7_runs"] = votes
+        if "agreement_v7_runs" not in sample_df:
+            sample_df["agreement_v7_runs"] = agreement
+
+
+def _annotations_revision() -> Tuple[int, int, int]:
+    """Changes whenever annotations.json is rewritten or the edit log grows."""
+    rev = []
+    for path in (ANNOTATIONS_PATH, ANNOTATIONS_LOG_PATH):
+        try:
+            stat = path.stat()
+            rev.append((stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            rev.append((0, 0))
+    return rev[0][0], rev[1][0], rev[1][1]
+
+
+def _read_annotations() -> Dict[str, dict]:
+    """annotations.json with the edit log replayed on top."""
+    ann: Dict[str, dict] = {}
     if ANNOTATIONS_PATH.exists():
         try:
-            return json.loads(ANNOTATIONS_PATH.read_text(encoding="utf-8"))
+            ann = _json_loads(ANNOTATIONS_PATH.read_bytes())
         except Exception:
-            return {}
-    return {}
+            ann = {}
+    if ANNOTATIONS_LOG_PATH.exists():
+        with ANNOTATIONS_LOG_PATH.open("rb") as fh:
+            for line in fh:
+                try:
+                    entry = _json_loads(line)
+                    ann[entry["ad_id"]] = entry["ann"]
+                except Exception:
+                    continue  # e.g. a line torn by a crash mid-append
+    return ann
+
+
+@st.cache_data(show_spinner=False)
+def _load_annotations(revision: Tuple[int, int, int]) -> Dict[str, dict]:
+    """
+    _read_annotations, keyed on _annotations_revision() so reruns skip parsing
+    until something is written.
+    """
+    return _read_annotations()
+
+
+@st.cache_resource(show_spinner=False)
+def _annotations_lock() -> threading.Lock:
+    """One lock per server process: every session writes the same files."""
+    return threading.Lock()
 
 
 def _save_annotations(ann: Dict[str, dict]) -> None:
     ANNOTATIONS_PATH.parent.mkdir(parents=True, exist_ok=True)
-    tmp = tempfile.NamedTemporaryFile("w", delete=False, dir=ANNOTATIONS_PATH.parent, encoding="utf-8")
-    json.dump(ann, tmp, ensure_ascii=False, indent=2)
-    tmp.flush()
-    os.fsync(tmp.fileno())
-    tmp.close()
-    Path(tmp.name).replace(ANNOTATIONS_PATH)
+    data = memoryview(_json_dumps(ann))
+    tmp = ANNOTATIONS_PATH.with_suffix(".json.tmp")
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        while data:
+            data = data[os.write(fd, data):]
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    os.replace(tmp, ANNOTATIONS_PATH)
+
+
+def _append_annotation(state, ad_id: str, new_ann: dict) -> None:
+    """
+    Persist one edit as a single fsynced line in the edit log instead of
+    rewriting every annotation; the rewrite happens later in _flush_annotations.
+    """
+    with state.annotations_lock:
+        # Unless another session wrote since this one last loaded, its own line
+        # is already in state.annotations and need not trigger a reload.
+        current = _annotations_revision() == state.annotations_rev
+        state.annotations[ad_id] = new_ann
+        ANNOTATIONS_LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
+        with ANNOTATIONS_LOG_PATH.open("ab") as fh:
+            fh.write(_json_dumps_line({"ad_id": ad_id, "ann": new_ann}))
+            fh.flush()
+            os.fsync(fh.fileno())
+        state.annotations_rev = _annotations_revision() if current else None
+
+
+def _flush_annotations(lock: threading.Lock) -> None:
+    """
+    Fold the edit log into annotations.json. Runs on a timer thread. Re-reads
+    both files rather than writing one session's copy, which would drop the
+    edits of every other session.
+    """
+    with lock:
+        try:
+            # annotations.json first: replaying the log over it again is harmless.
+            _save_annotations(_read_annotations())
+            ANNOTATIONS_LOG_PATH.unlink(missing_ok=True)
+        except OSError:
+            pass  # the log still holds every edit; the next flush retries
+
 
+def _schedule_flush(state) -> None:
+    """(Re)start the debounce timer, so a burst of edits costs one rewrite."""
+    timer = state.get("annotations_timer")
+    if timer is not None:
+        timer.cancel()
+    timer = threading.Timer(ANNOTATIONS_FLUSH_DELAY, _flush_annotations, args=(state.annotations_lock,))
+    timer.daemon = True
+    timer.start()
+    state.annotations_timer = timer
 
-def _mark_progress(sample: List[dict], ann: Dict[str, dict]) -> Tuple[int, Dict[str, int]]:
-    counts = {"True": 0, "Maybe": 0, "False": 0}
-    filled = 0
-    for row in sample:
-        a = ann.get(row["ad_id"])
-        if a and a.get("label") in counts:
-            counts[a["label"]] += 1
-            filled += 1
-    return filled, counts
 
+def _sample_frame(sample: List[dict], df: pd.DataFrame) -> pd.DataFrame:
+    """Columnar copy of a saved sample (one array per field), migrated against df."""
+    sample_df = pd.DataFrame(sample)
+    _migrate_sample_fields(sample_df, df)
+    return _narrow_dtypes(sample_df)
 
-def _refresh_flags(sample: List[dict]) -> None:
+
+def _narrow_dtypes(frame: pd.DataFrame) -> pd.DataFrame:
+    """
+    Smallest dtype per known column (int16 year, bool flags, int8 counts) rather
+    than the int64/object pandas infers; masks and the overview table get cheaper.
+    """
+    dtypes = {"year": "int16", "true_votes_v7_runs": "int8", "agreement_v7_runs": "int8"}
+    dtypes.update((f"{kind}_{v}", "bool") for kind in ("pos", "true") for v in VERSIONS)
+    dtypes.update((name, "bool") for name in ("changed_v7_vs_rerun", "changed_v6_vs_any"))
+    return frame.astype({col: dtype for col, dtype in dtypes.items() if col in frame})
+
+
+def _mark_progress(truth: pd.Series) -> Tuple[int, Dict[str, int]]:
+    found = truth.value_counts()
+    counts = {lab: int(found.get(lab, 0)) for lab in ("True", "Maybe", "False")}
+    return sum(counts.values()), counts
+
+
+def _refresh_flags(sample_df: pd.DataFrame) -> None:
     """
     Recompute true/pos flags from labels so that Maybe counts as False for the
     tick columns. This keeps the table consistent even if an old sample.json
     had different flags.
     """
-    for row in sample:
-        lv6 = row.get("label_v6")
-        lv7 = row.get("label_v7")
-        lv7r = row.get("label_v7_rerun")
-        lv7r2 = row.get("label_v7_rerun2")
-        row["true_v6"] = lv6 == "True"
-        row["true_v7"] = lv7 == "True"
-        row["true_v7_rerun"] = lv7r == "True"
-        row["true_v7_rerun2"] = lv7r2 == "True"
-        row["pos_v6"] = row["true_v6"]
-        row["pos_v7"] = row["true_v7"]
-        row["pos_v7_rerun"] = row["true_v7_rerun"]
-        row["pos_v7_rerun2"] = row["true_v7_rerun2"]
-
-
-def _assign_bucket(year: int) -> str | None:
-    for name, start, end in BUCKETS:
-        if start <= year <= end:
-            return name
-    return None
+    for version in VERSIONS:
+        is_true = sample_df[f"label_{version}"].eq(LABEL_TRUE).to_numpy()
+        sample_df[f"true_{version}"] = is_true
+        sample_df[f"pos_{version}"] = is_true
 
 
-def main() -> None:
-    st.set_page_config(page_title="AI requirements annotation", layout="wide")
-    st.title("AI requirements annotation (LLM outputs)")
+def _version_frame(src: Dict[int, Dict[str, AdRec]], version: str, texts: Dict[str, str]) -> pd.DataFrame:
+    rows = [
+        (ad_id, year, rec.label, rec.reason, rec.keywords)
+        for year, ads in src.items()
+        for ad_id, rec in ads.items()
+        if ad_id in texts
+    ]
+    cols = ["ad_id", "year", f"label_{version}", f"reason_{version}", f"keywords_{version}"]
+    return pd.DataFrame.from_records(rows, columns=cols).astype({"ad_id": object, "year": "int64"})
 
-    v6 = _load_results_all_v6()
-    v7 = _load_results_v7()
-    v7_rerun = _load_results_v7_rerun()
-    v7_rerun2 = _load_results_v7_rerun2()
-    if not v6 and not v7 and not v7_rerun and not v7_rerun2:
-        st.error("No results found. Check v6/v7 and rerun files.")
-        st.stop()
 
-    years = sorted(set(v6.keys()) | set(v7.keys()) | set(v7_rerun.keys()) | set(v7_rerun2.keys()))
-    texts = _load_texts(years)
-
-    records = []
-    for year in years:
-        ad_ids = set()
-        for src in (v6, v7, v7_rerun, v7_rerun2):
-            if year in src:
-                ad_ids.update(src[year].keys())
-        for ad_id in ad_ids:
-            txt = texts.get(ad_id)
-            if not txt:
-                continue
-            row = {"ad_id": ad_id, "year": year, "text": txt}
-            meta6 = (v6.get(year) or {}).get(ad_id, {})
-            lab6 = str(meta6.get("ai_requirement") or "False").capitalize()
-            row["label_v6"] = lab6 if lab6 in ("True", "Maybe") else "False"
-            row["reason_v6"] = meta6.get("reason", "")
-            row["keywords_v6"] = meta6.get("keywords", [])
-            row["pos_v6"] = row["label_v6"] in ("True", "Maybe")
-            row["true_v6"] = row["label_v6"] == "True"
-
-            meta7 = (v7.get(year) or {}).get(ad_id, {})
-            lab7 = str(meta7.get("ai_requirement") or "False").capitalize()
-            row["label_v7"] = lab7 if lab7 in ("True", "Maybe") else "False"
-            row["reason_v7"] = meta7.get("reason", "")
-            row["keywords_v7"] = meta7.get("keywords", [])
-            row["pos_v7"] = row["label_v7"] in ("True", "Maybe")
-            row["true_v7"] = row["label_v7"] == "True"
-
-            meta7r = (v7_rerun.get(year) or {}).get(ad_id, {})
-            lab7r = str(meta7r.get("ai_requirement") or "False").capitalize()
-            row["label_v7_rerun"] = lab7r if lab7r in ("True", "Maybe") else "False"
-            row["reason_v7_rerun"] = meta7r.get("reason", "")
-            row["keywords_v7_rerun"] = meta7r.get("keywords", [])
-            row["pos_v7_rerun"] = row["label_v7_rerun"] in ("True", "Maybe")
-            row["true_v7_rerun"] = row["label_v7_rerun"] == "True"
-
-            meta7r2 = (v7_rerun2.get(year) or {}).get(ad_id, {})
-            lab7r2 = str(meta7r2.get("ai_requirement") or "False").capitalize()
-            row["label_v7_rerun2"] = lab7r2 if lab7r2 in ("True", "Maybe") else "False"
-            row["reason_v7_rerun2"] = meta7r2.get("reason", "")
-            row["keywords_v7_rerun2"] = meta7r2.get("keywords", [])
-            row["pos_v7_rerun2"] = row["label_v7_rerun2"] in ("True", "Maybe")
-            row["true_v7_rerun2"] = row["label_v7_rerun2"] == "True"
-
-            row["changed_v7_vs_rerun"] = row["label_v7"] != row["label_v7_rerun"]
-            row["changed_v6_vs_any"] = (row["label_v6"] != row["label_v7"]) or (row["label_v6"] != row["label_v7_rerun"])
-            row["true_votes_v7_runs"] = sum(
-                int(lbl == "True")
-                for lbl in (row["label_v7"], row["label_v7_rerun"], row["label_v7_rerun2"])
-            )
-            row["agreement_v7_runs"] = 3 if (row["label_v7"] == row["label_v7_rerun"] == row["label_v7_rerun2"]) else (
-                2 if (
-                    row["label_v7"] == row["label_v7_rerun"] or
-                    row["label_v7"] == row["label_v7_rerun2"] or
-                    row["label_v7_rerun"] == row["label_v7_rerun2"]
-                ) else 0
-            )
+def _v7_run_stats(frame: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (true_votes_v7_runs, agreement_v7_runs) from the int8 category codes of the
+    three v7 runs: number of runs labelled True, and 3/2/0 for all/two/no runs
+    agreeing. Expects categorical label columns.
+    """
+    a, b, c = (frame[f"label_{v}"].cat.codes.to_numpy(np.int8) for v in ("v7", "v7_rerun", "v7_rerun2"))
+    votes = (a == _TRUE_CODE).astype(np.int64) + (b == _TRUE_CODE) + (c == _TRUE_CODE)
+    ab, ac, bc = a == b, a == c, b == c
+    agreement = np.where(ab & bc, 3, np.where(ab | ac | bc, 2, 0))
+    return votes, agreement
 
-            if row["pos_v6"] or row["pos_v7"] or row["pos_v7_rerun"]:
-                records.append(row)
 
-    df = pd.DataFrame(records)
-    if df.empty:
-        st.error("No data with text available after filtering True/Maybe across versions.")
-        st.stop()
+def _build_records(sources: Dict[str, Dict[int, Dict[str, AdRec]]], texts: Dict[str, str]) -> pd.DataFrame:
+    """
+    One row per (ad_id, year) with text that is True/Maybe in v6, v7 or v7 rerun.
+    Each version becomes a frame, the frames are outer-merged, and all derived
+    columns are computed column-wise instead of row by row.
+    """
+    df = None
+    for version, src in sources.items():
+        frame = _version_frame(src, version, texts)
+        df = frame if df is None else df.merge(frame, on=["ad_id", "year"], how="outer")
+    df.insert(2, "text", df["ad_id"].map(texts))
+
+    for version in sources:
+        label = df[f"label_{version}"].fillna(LABEL_FALSE)
+        df[f"label_{version}"] = label
+        df[f"reason_{version}"] = df[f"reason_{version}"].fillna("")
+        df[f"keywords_{version}"] = [kw if isinstance(kw, (list, tuple)) else [] for kw in df[f"keywords_{version}"]]
+        df[f"pos_{version}"] = label.ne(LABEL_FALSE).to_numpy()
+        df[f"true_{version}"] = label.eq(LABEL_TRUE).to_numpy()
+
+    df = df[df["pos_v6"] | df["pos_v7"] | df["pos_v7_rerun"]]
+    df = df.sort_values(["year", "ad_id"], ignore_index=True)
+    df[LABEL_COLUMNS] = df[LABEL_COLUMNS].astype(LABEL_DTYPE)
+
+    codes = {c: df[c].cat.codes.to_numpy() for c in LABEL_COLUMNS}
+    df["changed_v7_vs_rerun"] = codes["label_v7"] != codes["label_v7_rerun"]
+    df["changed_v6_vs_any"] = (codes["label_v6"] != codes["label_v7"]) | (codes["label_v6"] != codes["label_v7_rerun"])
+    df["true_votes_v7_runs"], df["agreement_v7_runs"] = _v7_run_stats(df)
+    return _narrow_dtypes(df)
+
+
+def _assign_buckets(years) -> np.ndarray:
+    """
+    Vectorised BUCKETS lookup: one searchsorted over the bucket start years
+    instead of a Python loop per row. Years outside every bucket map to None.
+    """
+    years = np.asarray(years)
+    pos = np.searchsorted(_BUCKET_STARTS, years, side="right") - 1
+    safe = pos.clip(0)
+    inside = (pos >= 0) & (years <= _BUCKET_ENDS[safe])
+    return np.where(inside, _BUCKET_NAMES[safe], None)
+
 
-    records_by_id = {r["ad_id"]: r for r in records}
-    sample = _load_sample(df)
-    _migrate_sample_fields(sample, records_by_id)
-    _refresh_flags(sample)
-    annotations = _load_annotations()
+def main() -> None:
+    st.set_page_config(page_title="AI requirements annotation", layout="wide")
+    st.title("AI requirements annotation (LLM outputs)")
 
-    filled, filled_counts = _mark_progress(sample, annotations)
-    total = len(sample)
+    # Everything up to the sample depends only on the input files: it is built
+    # once per server (_build_sample); a session copies it once and widget
+    # reruns only read the session-state copy.
+    if "sample_df" not in st.session_state:
+        sample_df = _build_sample(_results_signatures())
+        if sample_df is None:
+            st.error("No results found. Check v6/v7 and rerun files.")
+            st.stop()
+        if sample_df.empty:
+            st.error("No data with text available after filtering True/Maybe across versions.")
+            st.stop()
+        st.session_state.sample_df = sample_df
+    sample_df: pd.DataFrame = st.session_state.sample_df
+    # Edits go to this dict and the log; annotations.json is rewritten off the
+    # click path by _schedule_flush.
+    if "annotations_lock" not in st.session_state:
+        st.session_state.annotations_lock = _annotations_lock()
+        st.session_state.annotations_rev = None
+        st.session_state.annotations_edits = 0
+    # Other sessions write the same files: reload when they changed behind
+    # this session's back.
+    revision = _annotations_revision()
+    if revision != st.session_state.annotations_rev:
+        st.session_state.annotations = _load_annotations(revision)
+        st.session_state.annotations_rev = revision
+        st.session_state.annotations_edits += 1
+    annotations: Dict[str, dict] = st.session_state.annotations
+    # Annotation label per sample row (NaN = unannotated), built once per rerun
+    # and shared by the progress counts, the truth filter and the overview.
+    truth_map = {k: v.get("label") for k, v in annotations.items()}
+    truth = sample_df["ad_id"].map(truth_map)
+
+    filled, filled_counts = _mark_progress(truth)
+    total = len(sample_df)
 
     with st.sidebar:
         st.subheader("Progress")
@@ -356,7 +728,7 @@ def main() -> None:
         st.write(f"Annotated: {filled}/{total}")
         st.write(f"True: {filled_counts['True']}, Maybe: {filled_counts['Maybe']}, False: {filled_counts['False']}")
         st.markdown("---")
-        years_all = sorted({r["year"] for r in sample})
+        years_all = sorted(sample_df["year"].unique().tolist())
         year_sel = st.multiselect("Years", years_all, default=years_all)
         v6_filter = st.multiselect("v6 labels", ["True", "Maybe", "False"], default=["True", "Maybe", "False"])
         v7_filter = st.multiselect("v7 labels", ["True", "Maybe", "False"], default=["True", "Maybe", "False"])
@@ -416,100 +788,125 @@ def main() -> None:
         agreement_sel = st.selectbox("Filter by v7-run agreement level", ["Any", "3 (all same)", "2 (two match)", "0 (all different)"])
         jump_id = st.text_input("Jump to ad_id")
         if st.button("Jump") and jump_id:
-            for i, row in enumerate(sample):
-                if row["ad_id"] == jump_id:
-                    st.session_state.idx = i
-                    break
-
-    if not sample:
+            hits = np.flatnonzero(sample_df["ad_id"].to_numpy() == jump_id)
+            if hits.size:
+                st.session_state.idx = int(hits[0])
+
+    # Set membership for the mask, and selections that hash the same whatever
+    # order the values were picked in.
+    year_sel = frozenset(year_sel)
+    v6_filter = frozenset(v6_filter)
+    v7_filter = frozenset(v7_filter)
+    v7r_filter = frozenset(v7r_filter)
+    v7r2_filter = frozenset(v7r2_filter)
+
+    if sample_df.empty:
         st.warning("Sample is empty. Check data availability.")
         st.stop()
 
-    def cond_match(r, ver, op, val):
-        label = r.get(f"label_{ver}")
-        if op == "=":
-            return label == val
-        return label != val
+    def cond_match(ver, op, val):
+        hit = sample_df[f"label_{ver}"].eq(val)
+        return hit if op == "=" else ~hit
 
-    def apply_comparison(r):
+    def apply_comparison():
+        keep_all = pd.Series(True, index=sample_df.index)
         if mode == "None":
-            return True
+            return keep_all
         if mode == "Preset":
+            lv7 = sample_df["label_v7"]
+            lv7r = sample_df["label_v7_rerun"]
+            lv7r2 = sample_df["label_v7_rerun2"]
             if preset == "None" or preset is None:
-                return True
+                return keep_all
             if preset == "v7 == v7 rerun":
-                return r["label_v7"] == r["label_v7_rerun"]
+                return lv7 == lv7r
             if preset == "v7 != v7 rerun":
-                return r["label_v7"] != r["label_v7_rerun"]
+                return lv7 != lv7r
             if preset == "v7 = True AND v7 rerun = False":
-                return r["label_v7"] == "True" and r["label_v7_rerun"] == "False"
+                return lv7.eq("True") & lv7r.eq("False")
             if preset == "v7 = False AND v7 rerun = True":
-                return r["label_v7"] == "False" and r["label_v7_rerun"] == "True"
+                return lv7.eq("False") & lv7r.eq("True")
             if preset == "v7 = Maybe AND v7 rerun = True":
-                return r["label_v7"] == "Maybe" and r["label_v7_rerun"] == "True"
+                return lv7.eq("Maybe") & lv7r.eq("True")
             if preset == "v7 = True AND v7 rerun2 = False":
-                return r["label_v7"] == "True" and r["label_v7_rerun2"] == "False"
+                return lv7.eq("True") & lv7r2.eq("False")
             if preset == "v7 = False AND v7 rerun2 = True":
-                return r["label_v7"] == "False" and r["label_v7_rerun2"] == "True"
-            return True
+                return lv7.eq("False") & lv7r2.eq("True")
+            return keep_all
         if mode == "Advanced" and cond_a and cond_b and cond_c and logic_op1 and logic_op2:
-            a_ok = cond_match(r, *cond_a)
-            b_ok = cond_match(r, *cond_b)
-            c_ok = cond_match(r, *cond_c)
-            first = (a_ok and b_ok) if logic_op1 == "AND" else (a_ok or b_ok)
-            return (first and c_ok) if logic_op2 == "AND" else (first or c_ok)
-        return True
-
-    def matches_filters(r):
-        if r["year"] not in year_sel:
-            return False
-        if r["label_v6"] not in v6_filter:
-            return False
-        if r["label_v7"] not in v7_filter:
-            return False
-        if r["label_v7_rerun"] not in v7r_filter:
-            return False
-        if r["label_v7_rerun2"] not in v7r2_filter:
-            return False
-        if pred_v7_filter != "Any" and r["label_v7"] != pred_v7_filter:
-            return False
-        # truth comes from annotations dict; if missing -> Unannotated
-        truth_label = annotations.get(r["ad_id"], {}).get("label")
-        if truth_filter != "Any":
-            if truth_filter == "Unannotated" and truth_label is not None:
-                return False
-            if truth_filter != "Unannotated" and truth_label != truth_filter:
-                return False
-        if not apply_comparison(r):
-            return False
-        if filter_changed_v7_vs_rerun and not r.get("changed_v7_vs_rerun"):
-            return False
+            a_ok = cond_match(*cond_a)
+            b_ok = cond_match(*cond_b)
+            c_ok = cond_match(*cond_c)
+            first = (a_ok & b_ok) if logic_op1 == "AND" else (a_ok | b_ok)
+            return (first & c_ok) if logic_op2 == "AND" else (first | c_ok)
+        return keep_all
+
+    def flag_column(name):
+        if name not in sample_df:
+            return pd.Series(False, index=sample_df.index)
+        return sample_df[name].fillna(False).astype(bool)
+
+    def filter_mask():
+        """All sidebar filters as one boolean mask over sample_df."""
+        d = sample_df
+        mask = (
+            d["year"].isin(year_sel)
+            & d["label_v6"].isin(v6_filter)
+            & d["label_v7"].isin(v7_filter)
+            & d["label_v7_rerun"].isin(v7r_filter)
+            & d["label_v7_rerun2"].isin(v7r2_filter)
+        )
+        if pred_v7_filter != "Any":
+            mask &= d["label_v7"].eq(pred_v7_filter)
+        if truth_filter == "Unannotated":
+            mask &= truth.isna()
+        elif truth_filter != "Any":
+            mask &= truth.eq(truth_filter)
+        mask &= apply_comparison()
+        if filter_changed_v7_vs_rerun:
+            mask &= flag_column("changed_v7_vs_rerun")
         if filter_changed_any_v7_runs:
-            if not (
-                r.get("label_v7") == r.get("label_v7_rerun") == r.get("label_v7_rerun2")
-            ):
-                pass
-            else:
-                return False
-        if filter_none_true_v7_runs and r.get("true_votes_v7_runs", 0) != 0:
-            return False
-        if filter_at_least_two_true and r.get("true_votes_v7_runs", 0) < 2:
-            return False
-        if filter_exactly_one_true and r.get("true_votes_v7_runs", 0) != 1:
-            return False
-        if filter_exactly_two_true and r.get("true_votes_v7_runs", 0) != 2:
-            return False
+            mask &= ~(d["label_v7"].eq(d["label_v7_rerun"]) & d["label_v7_rerun"].eq(d["label_v7_rerun2"]))
+        votes = d["true_votes_v7_runs"]
+        if filter_none_true_v7_runs:
+            mask &= votes.eq(0)
+        if filter_at_least_two_true:
+            mask &= votes.ge(2)
+        if filter_exactly_one_true:
+            mask &= votes.eq(1)
+        if filter_exactly_two_true:
+            mask &= votes.eq(2)
         if agreement_sel != "Any":
             target = {"3 (all same)": 3, "2 (two match)": 2, "0 (all different)": 0}[agreement_sel]
-            if r.get("agreement_v7_runs") != target:
-                return False
-        if filter_changed_v6_vs_any and not r.get("changed_v6_vs_any"):
-            return False
-        if filter_only_non_annotated and r["ad_id"] in annotations:
-            return False
-        return True
-
-    filtered_indices = [i for i, r in enumerate(sample) if matches_filters(r)]
+            mask &= d["agreement_v7_runs"].eq(target)
+        if filter_changed_v6_vs_any:
+            mask &= flag_column("changed_v6_vs_any")
+        if filter_only_non_annotated:
+            mask &= ~d["ad_id"].isin(list(annotations))
+        return mask
+
+    # Navigation reruns the script without touching the sidebar; reuse the mask
+    # unless a filter (or, for annotation-based filters, the annotations) changed.
+    uses_annotations = truth_filter != "Any" or filter_only_non_annotated
+    filter_key = hash(
+        (
+            id(sample_df),
+            year_sel, v6_filter, v7_filter, v7r_filter, v7r2_filter,
+            pred_v7_filter, truth_filter, mode, preset,
+            (cond_a, cond_b, cond_c, logic_op1, logic_op2) if mode == "Advanced" else None,
+            filter_changed_v7_vs_rerun, filter_changed_any_v7_runs, filter_changed_v6_vs_any,
+            filter_only_non_annotated, filter_none_true_v7_runs, filter_at_least_two_true,
+            filter_exactly_one_true, filter_exactly_two_true, agreement_sel,
+            st.session_state.annotations_edits if uses_annotations else None,
+        )
+    )
+    cached = st.session_state.get("filter_cache")
+    if cached is not None and cached[0] == filter_key:
+        _, mask, filtered_indices = cached
+    else:
+        mask = filter_mask()
+        filtered_indices = np.flatnonzero(mask.to_numpy()).tolist()
+        st.session_state.filter_cache = (filter_key, mask, filtered_indices)
     if not filtered_indices:
         st.warning("No records match current filters.")
         st.stop()
@@ -517,14 +914,14 @@ def main() -> None:
     if "idx" not in st.session_state or st.session_state.idx not in filtered_indices:
         st.session_state.idx = filtered_indices[0]
 
-    idx = _current_index_state(len(sample))
+    idx = _current_index_state(len(sample_df))
     if idx not in filtered_indices:
         diffs = [(abs(i - idx), i) for i in filtered_indices]
         st.session_state.idx = sorted(diffs)[0][1]
         idx = st.session_state.idx
 
-    row = sample[idx]
-    st.subheader(f"Ad {idx + 1}/{len(sample)} (filtered {len(filtered_indices)}) | Year {row['year']} | ad_id {row['ad_id']}")
+    row = sample_df.iloc[idx].to_dict()
+    st.subheader(f"Ad {idx + 1}/{len(sample_df)} (filtered {len(filtered_indices)}) | Year {row['year']} | ad_id {row['ad_id']}")
 
     def fmt_kw(kw_list):
         return " | ".join(kw_list) if kw_list else "—"
@@ -582,8 +979,10 @@ def main() -> None:
             "flag": flag,
         }
         if new_ann != current_ann:
-            annotations[row["ad_id"]] = new_ann
-            _save_annotations(annotations)
+            _append_annotation(st.session_state, row["ad_id"], new_ann)
+            _schedule_flush(st.session_state)
+            st.session_state.annotations_edits += 1
+            truth_map[row["ad_id"]] = label
             st.toast("Saved", icon="💾")
 
     c1, c2 = st.columns(2)
@@ -608,29 +1007,21 @@ def main() -> None:
 
     st.markdown("---")
     st.subheader("Sample overview (filtered)")
-    ann_labels = {k: v.get("label") for k, v in annotations.items()}
-    sample_view = []
-    for i in filtered_indices:
-        r = sample[i]
-        sample_view.append(
-            {
-                "ad_id": r["ad_id"],
-                "year": r["year"],
-                "bucket": _assign_bucket(r["year"]),
-                "label_v6": r["label_v6"],
-                "label_v7": r["label_v7"],
-                "label_v7_rerun": r["label_v7_rerun"],
-                "label_v7_rerun2": r["label_v7_rerun2"],
-                "pos_v6": r["pos_v6"],
-                "pos_v7": r["pos_v7"],
-                "pos_v7_rerun": r["pos_v7_rerun"],
-                "pos_v7_rerun2": r["pos_v7_rerun2"],
-                "user_label": ann_labels.get(r["ad_id"], ""),
-                "flag": bool(annotations.get(r["ad_id"], {}).get("flag")),
-                "true_votes_v7_runs": r.get("true_votes_v7_runs", 0),
-            }
-        )
-    st.dataframe(pd.DataFrame(sample_view))
+    # Same filters and no new edits (e.g. Prev/Next): reuse the last table.
+    view_key = (filter_key, st.session_state.annotations_edits)
+    cached_view = st.session_state.get("view_cache")
+    if cached_view is not None and cached_view[0] == view_key:
+        view = cached_view[1]
+    else:
+        ann_flags = {k: bool(v.get("flag")) for k, v in annotations.items()}
+        view_cols = ["ad_id", "year", *LABEL_COLUMNS, *(f"pos_{v}" for v in VERSIONS)]
+        view = sample_df.loc[mask, view_cols].reset_index(drop=True)
+        view["user_label"] = view["ad_id"].map(truth_map).fillna("")
+        view["flag"] = view["ad_id"].map(ann_flags).fillna(False).astype(bool)
+        view["true_votes_v7_runs"] = sample_df.loc[mask, "true_votes_v7_runs"].to_numpy()
+        view.insert(2, "bucket", _assign_buckets(view["year"].to_numpy()))
+        st.session_state.view_cache = (view_key, view)
+    st.dataframe(view)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Transcode the SJMM ad-text archives (ads_sjmm_{year}.jsonl.bz2) into a single
+zstd-compressed Parquet store, so the review app can skip bz2 decompression and
+per-line JSON parsing on every start. Run once (or again after the source
+archives change); the app also calls write_store() itself when the store is
+missing or was built from different archives.
+Output: streamlit_review/data/ad_texts.parquet with columns
+  - ad_id (dictionary-encoded string), year (int16), text (large_string)
+and the archives it was built from (archive_signature) in its schema metadata.
+"""
+from __future__ import annotations
+
+import bz2
+import json
+import os
+import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+try:  # optional: decodes bz2 blocks on all cores
+    from indexed_bzip2 import IndexedBzip2File
+except ImportError:
+    IndexedBzip2File = None
+
+try:  # optional: several times faster than the stdlib json module
+    import orjson
+except ImportError:
+    orjson = None
+
+try:  # optional: on-demand parsing that materialises only the fields read
+    import simdjson
+except ImportError:
+    simdjson = None
+
+BASE = Path(__file__).resolve().parent  # streamlit_review/
+OUT_PATH = BASE / "data" / "ad_texts.parquet"
+# ad texts live under the repo root (BASE.parent)
+TEXT_DIR = BASE.parent / "Base Dataset" / "Data" / "699_SJMM_Data_TextualData_v10.0" / "sjmm_suf_ad_texts"
+
+SCHEMA = pa.schema(
+    [
+        ("ad_id", pa.dictionary(pa.int32(), pa.string())),
+        ("year", pa.int16()),
+        ("text", pa.large_string()),
+    ]
+)
+YEAR_RE = re.compile(r"ads_sjmm_(\d{4})\.jsonl\.bz2$")
+# Archives decoded ahead of the one being written (stdlib bz2 only); bounds
+# how many years' texts are in memory at once.
+READ_AHEAD = 4
+
+
+def archives(text_dir: Path = TEXT_DIR) -> dict[int, Path]:
+    """{year: archive path}, in year order."""
+    found: dict[int, Path] = {}
+    for path in sorted(text_dir.glob("ads_sjmm_*.jsonl.bz2")):
+        m = YEAR_RE.search(path.name)
+        if m:
+            found[int(m.group(1))] = path
+    return dict(sorted(found.items()))
+
+
+def archive_signature(paths: dict[int, Path]) -> bytes:
+    """
+    (year, name, mtime_ns, size) of every archive, as stored in the schema
+    metadata; any added, removed or changed archive gives a different value.
+    """
+    sig = []
+    for year, path in paths.items():
+        stat = path.stat()
+        sig.append([year, path.name, stat.st_mtime_ns, stat.st_size])
+    return json.dumps(sig).encode("utf-8")
+
+
+def store_signature(path: Path = OUT_PATH) -> bytes | None:
+    """archive_signature() recorded in an existing store; None if absent."""
+    try:
+        return (pq.read_schema(path).metadata or {}).get(b"archives")
+    except Exception:
+        return None
+
+
+def _open_bz2(path: Path):
+    """Binary line reader; JSON parsers take the undecoded bytes directly."""
+    if IndexedBzip2File is None:
+        return bz2.open(path, "rb")
+    return IndexedBzip2File(str(path), parallelization=os.cpu_count() or 1)
+
+
+def _ad_fields(line: bytes, parser=None) -> tuple[object, object]:
+    """
+    (ad_id, text) of one archive line. With a simdjson parser only these two
+    fields are materialised; the document proxy must be gone before the parser
+    is reused, hence the separate function scope.
+    """
+    if parser is not None:
+        doc = parser.parse(line)
+        return doc.get("adve_iden_adve"), doc.get("adve_text_adve")
+    obj = orjson.loads(line) if orjson is not None else json.loads(line)
+    return obj.get("adve_iden_adve"), obj.get("adve_text_adve")
+
+
+def read_year(path: Path) -> tuple[list[str], list[str]]:
+    """(ad_ids, texts) of one archive; a truncated archive yields what was read."""
+    ids: list[str] = []
+    texts: list[str] = []
+    parser = simdjson.Parser() if simdjson is not None else None
+    try:
+        with _open_bz2(path) as fh:
+            for line in fh:
+                try:
+                    ad_id, txt = _ad_fields(line, parser)
+                except Exception:
+                    continue
+                txt = txt or ""
+                if isinstance(ad_id, str) and isinstance(txt, str) and txt.strip():
+                    ids.append(ad_id)
+                    texts.append(txt)
+    except Exception:
+        pass
+    return ids, texts
+
+
+def read_years(paths: dict[int, Path]):
+    """
+    (year, ad_ids, texts) per archive, in the order of `paths`. indexed_bzip2
+    already decodes each archive on every core, so archives are then read one
+    at a time. With the stdlib bz2, whose decompression releases the GIL, a
+    small thread pool reads up to READ_AHEAD archives ahead.
+    """
+    items = iter(paths.items())
+    workers = min(READ_AHEAD, len(paths), os.cpu_count() or 1)
+    if IndexedBzip2File is not None or workers <= 1:
+        for year, path in items:
+            yield (year, *read_year(path))
+        return
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        pending = deque()
+        for year, path in items:
+            pending.append((year, ex.submit(read_year, path)))
+            if len(pending) == workers:
+                break
+        while pending:
+            year, fut = pending.popleft()
+            nxt = next(items, None)
+            if nxt is not None:
+                pending.append((nxt[0], ex.submit(read_year, nxt[1])))
+            yield (year, *fut.result())
+
+
+def write_store(
+    paths: dict[int, Path],
+    out_path: Path = OUT_PATH,
+    keep: set[str] | None = None,
+    keep_years: set[int] | None = None,
+    verbose: bool = False,
+) -> dict[str, str]:
+    """
+    Write every archive in `paths` to out_path, one year per table, so only the
+    years being read (see read_years) are ever in memory. Returns the texts of the ad_ids in `keep`
+    from the years in `keep_years` (all years if None), picked out while each
+    year is read; later years win on duplicate ad_ids.
+    """
+    kept: dict[str, str] = {}
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out_path.with_suffix(".parquet.tmp")
+    total = 0
+    schema = SCHEMA.with_metadata({b"archives": archive_signature(paths)})
+    with pq.ParquetWriter(tmp, schema, compression="zstd") as writer:
+        for year, ids, texts in read_years(paths):
+            table = pa.table(
+                {
+                    "ad_id": pa.array(ids, type=pa.string()).dictionary_encode(),
+                    "year": pa.array([year] * len(ids), type=pa.int16()),
+                    "text": pa.array(texts, type=pa.large_string()),
+                },
+                schema=SCHEMA,
+            )
+            writer.write_table(table)
+            if keep and (keep_years is None or year in keep_years):
+                kept.update((ad_id, txt) for ad_id, txt in zip(ids, texts) if ad_id in keep)
+            total += len(ids)
+            if verbose:
+                print(f"{year}: {len(ids)} texts")
+    tmp.replace(out_path)
+    if verbose:
+        print(f"Saved {total} texts to {out_path}")
+    return kept
+
+
+def main() -> None:
+    write_store(archives(), verbose=True)
+
+
+if __name__ == "__main__":
+    main()
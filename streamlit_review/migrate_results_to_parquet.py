@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Convert the LLM requirement results (v6, v7, v7 rerun, v7 rerun2 JSON files) into
+one hive-partitioned Parquet dataset that the review app scans instead of
+re-parsing every JSON file. Run once (or again after the JSON results change).
+Output: Results Datasets/.../requirements/parquet/version=<v>/year=<yyyy>/*.parquet
+with columns {ad_id, ai_requirement, reason, keywords}
+"""
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+BASE = Path(__file__).resolve().parent  # streamlit_review/
+# results live under the repo root (BASE.parent)
+RESULTS_DIR = BASE.parent / "Results Datasets" / "ai_mentions" / "results" / "requirements"
+OUT_DIR = RESULTS_DIR / "parquet"
+
+SOURCES = {
+    "v6": ("v6", "ai_job_requirements_all_*_v6.json"),
+    "v7": ("v7", "ai_job_requirements_all_*_v7.json"),
+    "v7_rerun": ("v7_rerun", "ai_job_requirements_all_2010_2024_v7_rerun.json"),
+    "v7_rerun2": ("v7_rerun2", "ai_job_requirements_all_2010_2024_v7_rerun2.json"),
+}
+
+SCHEMA = pa.schema(
+    [
+        ("ad_id", pa.string()),
+        ("ai_requirement", pa.string()),
+        ("reason", pa.string()),
+        ("keywords", pa.list_(pa.string())),
+        ("version", pa.string()),
+        ("year", pa.int16()),
+    ]
+)
+
+
+def load_version(version: str) -> dict[int, dict[str, dict]]:
+    subdir, pattern = SOURCES[version]
+    res: dict[int, dict[str, dict]] = {}
+    for p in sorted((RESULTS_DIR / subdir).glob(pattern)):
+        try:
+            data = json.loads(p.read_text(encoding="utf-8"))
+        except Exception:
+            continue
+        for y_str, ads in data.items():
+            try:
+                year = int(y_str)
+            except Exception:
+                continue
+            if isinstance(ads, dict):
+                res.setdefault(year, {}).update(ads)
+    return res
+
+
+def to_table(version: str, results: dict[int, dict[str, dict]]) -> pa.Table:
+    cols: dict[str, list] = {name: [] for name in SCHEMA.names}
+    for year, ads in results.items():
+        for ad_id, meta in ads.items():
+            if not isinstance(meta, dict):
+                continue
+            raw = meta.get("ai_requirement")
+            reason = meta.get("reason")
+            keywords = meta.get("keywords")
+            cols["ad_id"].append(ad_id)
+            cols["ai_requirement"].append(None if raw is None else str(raw))
+            cols["reason"].append(None if reason is None else str(reason))
+            cols["keywords"].append([str(k) for k in keywords] if isinstance(keywords, list) else None)
+            cols["version"].append(version)
+            cols["year"].append(year)
+    return pa.table(cols, schema=SCHEMA)
+
+
+def main() -> None:
+    tables = []
+    for version in SOURCES:
+        table = to_table(version, load_version(version))
+        print(f"{version}: {table.num_rows} rows")
+        tables.append(table)
+    ds.write_dataset(
+        pa.concat_tables(tables),
+        OUT_DIR,
+        format="parquet",
+        partitioning=["version", "year"],
+        partitioning_flavor="hive",
+        existing_data_behavior="delete_matching",
+        file_options=ds.ParquetFileFormat().make_write_options(compression="zstd"),
+    )
+    print(f"Saved dataset to {OUT_DIR}")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,21 +6,56 @@ Targets (match final_annotations_test style):
   - Pred totals: True 100, Maybe 100, False 250
   - Per-pred bucket counts: True 20/30/50, Maybe 20/30/50, False 50/75/125
 Output: streamlit_review/data/annotations_set.json with fields {ad_id: {v7, year}}
+Also writes a JSON Lines copy (.jsonl) next to each v7 file, read instead of the
+nested JSON on later runs until the source file changes.
 """
 from __future__ import annotations
 
+import functools
+import hashlib
+import importlib
 import json
+import os
+import pickle
 import random
-from collections import Counter, defaultdict
+import re
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 BASE = Path(__file__).resolve().parent  # streamlit_review/
 OUT_PATH = BASE / "data" / "annotations_set.json"
 # v7 files live under the repo root (BASE.parent)
 V7_DIR = BASE.parent / "Results Datasets" / "ai_mentions" / "results" / "requirements" / "v7"
+# Parsed predictions, keyed by the mtime/size of every v7 file.
+CACHE_DIR = BASE / ".cache"
+# Bump when what _parse_one keeps changes so stale pickles are ignored.
+_CACHE_FORMAT = 4
+# Read size for the streamed formats (JSON Lines copies, ijson).
+READ_BUFFER = 1 << 20
 
 SEED = 42
-random.seed(SEED)
+
+
+@functools.lru_cache(maxsize=None)
+def _optional(name: str):
+    """
+    Optional accelerator (orjson/ujson, ijson, numpy), imported on first use
+    rather than at import time; None when it is not installed.
+    """
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
+
+
+def _loader():
+    """Fastest available JSON parser: orjson, then ujson, then the stdlib."""
+    for name in ("orjson", "ujson"):
+        mod = _optional(name)
+        if mod is not None:
+            return mod.loads
+    return json.loads
+
 
 BUCKET_TARGETS = {"early": 90, "mid": 135, "late": 225}
 PRED_BUCKET_TARGETS = {
@@ -28,70 +63,235 @@ PRED_BUCKET_TARGETS = {
     "Maybe": {"early": 20, "mid": 30, "late": 50},
     "False": {"early": 50, "mid": 75, "late": 125},
 }
+# PRED_BUCKET_TARGETS flattened once: (label, bucket, target) per stratum.
+_TARGETS = tuple((label, b, tgt) for label, buckets in PRED_BUCKET_TARGETS.items() for b, tgt in buckets.items())
+_VALID = frozenset(PRED_BUCKET_TARGETS)
+# Raw ai_requirement spellings -> label; other values fall back to .capitalize().
+_LABEL_MAP = {
+    spelling: label
+    for label in PRED_BUCKET_TARGETS
+    for spelling in (label, label.lower(), label.upper())
+}
 
 
-def bucket(year: int) -> str | None:
-    if 2010 <= year <= 2014:
-        return "early"
-    if 2015 <= year <= 2019:
-        return "mid"
-    if 2020 <= year <= 2024:
-        return "late"
-    return None
+# (name, first year, last year) per bucket, in order; every year edge below is
+# derived from this table.
+BUCKETS = (("early", 2010, 2014), ("mid", 2015, 2019), ("late", 2020, 2024))
+BUCKET_NAMES = tuple(name for name, _, _ in BUCKETS)
+_FIRST_YEAR = BUCKETS[0][1]
+_LAST_YEAR = BUCKETS[-1][2]
+# year -> index into BUCKET_NAMES: one lookup instead of range checks.
+_BUCKET_POS = {year: i for i, (_, first, last) in enumerate(BUCKETS) for year in range(first, last + 1)}
 
 
-def load_v7_predictions() -> dict[str, tuple[str, int]]:
-    preds: dict[str, tuple[str, int]] = {}
-    for p in V7_DIR.glob("ai_job_requirements_all_*_v7.json"):
+def bucket_indices(years: list[int]) -> list[int]:
+    """
+    Index into BUCKET_NAMES for each year, -1 outside every bucket. One
+    searchsorted with numpy, a dict lookup per year without.
+    """
+    np = _optional("numpy")
+    if np is None:
+        return [_BUCKET_POS.get(year, -1) for year in years]
+    arr = np.fromiter(years, dtype=np.int64, count=len(years))  # any int year key fits
+    idx = np.searchsorted(np.array([first for _, first, _ in BUCKETS[1:]]), arr, side="right")
+    return np.where((arr >= _FIRST_YEAR) & (arr <= _LAST_YEAR), idx, -1).tolist()
+
+
+def _dumps(obj) -> bytes:
+    """Indented JSON as UTF-8 bytes, newline-terminated."""
+    orjson = _optional("orjson")
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_APPEND_NEWLINE)
+    return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8") + b"\n"
+
+
+def _dumps_line(obj) -> bytes:
+    orjson = _optional("orjson")
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE)
+    return json.dumps(obj, ensure_ascii=False).encode("utf-8") + b"\n"
+
+
+def _year_items(p: Path):
+    """
+    (year string, {ad_id: payload}) pairs of one v7 file. With ijson only one
+    year's ads are materialised at a time instead of the whole file.
+    """
+    ijson = _optional("ijson")
+    if ijson is None:
+        yield from _loader()(p.read_bytes()).items()
+        return
+    with p.open("rb", buffering=0) as fh:
+        yield from ijson.kvitems(fh, "", buf_size=READ_BUFFER)
+
+
+def _read_json_file(p: Path) -> list[tuple[str, str, int]]:
+    """(ad_id, raw ai_requirement, year) for every ad of a nested v7 file."""
+    rows: list[tuple[str, str, int]] = []
+    for y_str, ads in _year_items(p):
         try:
-            data = json.loads(p.read_text(encoding="utf-8"))
+            year = int(y_str)
         except Exception:
             continue
-        for y_str, ads in data.items():
-            try:
-                year = int(y_str)
-            except Exception:
-                continue
-            for ad_id, payload in ads.items():
-                label = str(payload.get("ai_requirement", "False")).capitalize()
-                preds[ad_id] = (label, year)
+        for ad_id, payload in ads.items():
+            rows.append((ad_id, str(payload.get("ai_requirement", "False")), year))
+    return rows
+
+
+def _read_jsonl_file(p: Path) -> list[tuple[str, str, int]]:
+    rows: list[tuple[str, str, int]] = []
+    loads = _loader()
+    with p.open("rb", buffering=READ_BUFFER) as fh:
+        for line in fh:
+            rec = loads(line)
+            rows.append((rec["ad_id"], rec["ai_requirement"], rec["year"]))
+    return rows
+
+
+def convert_v7_to_jsonl(out_path: Path, rows: list[tuple[str, str, int]]) -> None:
+    """Write one {"ad_id", "year", "ai_requirement"} object per line."""
+    tmp = out_path.with_suffix(".jsonl.tmp")
+    with tmp.open("wb") as fh:
+        fh.writelines(_dumps_line({"ad_id": ad_id, "year": year, "ai_requirement": raw}) for ad_id, raw, year in rows)
+    tmp.replace(out_path)
+
+
+def _parse_one(p: Path) -> list[tuple[str, str, int]]:
+    """
+    (ad_id, label, year) triples of one v7 file, for labels and years that can
+    be sampled; [] if the file cannot be read.
+    Reads the JSON Lines copy when it is up to date and readable, otherwise
+    parses the nested JSON and (re)writes that copy for the next run. Runs in a worker process, so it
+    returns flat tuples, which are cheap to send back.
+    """
+    jsonl = p.with_suffix(".jsonl")
+    rows = None
+    try:
+        if jsonl.exists() and jsonl.stat().st_mtime_ns >= p.stat().st_mtime_ns:
+            rows = _read_jsonl_file(jsonl)
+    except Exception:
+        pass  # truncated or hand-edited copy: rebuild it from the source
+    if rows is None:
+        try:
+            rows = _read_json_file(p)
+        except Exception:
+            return []  # unreadable or truncated source: skip it entirely
+        try:
+            convert_v7_to_jsonl(jsonl, rows)
+        except OSError:
+            pass
+    triples = []
+    for ad_id, raw, year in rows:
+        label = _LABEL_MAP.get(raw) or raw.capitalize()
+        if label not in _VALID or not (_FIRST_YEAR <= year <= _LAST_YEAR):
+            continue  # never sampled: drop before it reaches preds
+        triples.append((ad_id, label, year))
+    return triples
+
+
+def _cache_key(paths: list[Path]) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"format:{_CACHE_FORMAT}\n".encode("utf-8"))
+    for p in sorted(paths):
+        st = p.stat()
+        h.update(f"{p}:{st.st_mtime_ns}:{st.st_size}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+# Year span in a v7 file name, e.g. ..._all_2010_2024_v7.json or ..._all_2015_v7.json
+_FILE_YEARS_RE = re.compile(r"_all_(\d{4})(?:_(\d{4}))?_v7\.json$")
+
+
+def _may_hold_sampled_years(p: Path) -> bool:
+    """False only when the file name shows every year is outside the buckets."""
+    m = _FILE_YEARS_RE.search(p.name)
+    if not m:
+        return True
+    first = int(m.group(1))
+    last = int(m.group(2) or first)
+    return first <= _LAST_YEAR and last >= _FIRST_YEAR
+
+
+def load_v7_predictions() -> dict[str, tuple[str, int]]:
+    """
+    Unpickles the predictions when no v7 file changed since the last run.
+    Otherwise the files, which are independent, are parsed on all cores. They
+    are merged in name order, so later files win on duplicate ad_ids and the
+    reservoirs see the same record order on every machine.
+    """
+    paths = [p for p in sorted(V7_DIR.glob("ai_job_requirements_all_*_v7.json")) if _may_hold_sampled_years(p)]
+    cache_path = CACHE_DIR / f"v7_preds_{_cache_key(paths)}.pkl"
+    if cache_path.exists():
+        try:
+            with cache_path.open("rb") as fh:
+                return pickle.load(fh)
+        except Exception:
+            pass
+
+    preds: dict[str, tuple[str, int]] = {}
+    if len(paths) <= 1:
+        parsed = [_parse_one(p) for p in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=min(len(paths), os.cpu_count() or 1)) as ex:
+            parsed = list(ex.map(_parse_one, paths))
+    for triples in parsed:
+        preds.update((ad_id, (label, year)) for ad_id, label, year in triples)
+
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        for old in CACHE_DIR.glob("v7_preds_*.pkl"):
+            old.unlink()
+        tmp = cache_path.with_suffix(".pkl.tmp")
+        with tmp.open("wb") as fh:
+            pickle.dump(preds, fh, protocol=5)
+        tmp.replace(cache_path)
+    except OSError:
+        pass
     return preds
 
 
 def main() -> None:
     preds = load_v7_predictions()
 
-    pools: dict[tuple[str, str], list[dict]] = defaultdict(list)  # (label, bucket) -> list
-    for ad_id, (label, year) in preds.items():
-        b = bucket(year)
-        if b is None:
-            continue
-        if label not in PRED_BUCKET_TARGETS:
+    # Per-(label, bucket) reservoir sampling (Algorithm R): one pass over the
+    # predictions keeps only `tgt` (ad_id, year) pairs per stratum, each stratum
+    # still drawn uniformly. Every stratum has its own seeded generator, so its
+    # sample depends on its own records only.
+    reservoirs: dict[tuple[str, str], list[tuple[str, int]]] = {(label, b): [] for label, b, _ in _TARGETS}
+    targets = {(label, b): tgt for label, b, tgt in _TARGETS}
+    seen = dict.fromkeys(reservoirs, 0)
+    rngs = {(label, b): random.Random(f"{SEED}:{label}:{b}") for label, b, _ in _TARGETS}
+    years = [year for _, year in preds.values()]
+    for (ad_id, (label, year)), bi in zip(preds.items(), bucket_indices(years)):
+        if bi < 0:
             continue
-        pools[(label, b)].append({"ad_id": ad_id, "v7": label, "year": year})
-
-    # availability check
-    for label, buckets in PRED_BUCKET_TARGETS.items():
-        for b, tgt in buckets.items():
-            avail = len(pools.get((label, b), []))
-            if avail < tgt:
-                raise SystemExit(f"Not enough candidates for {label} in {b}: need {tgt}, have {avail}")
-
-    selected = []
-    for label, buckets in PRED_BUCKET_TARGETS.items():
-        for b, tgt in buckets.items():
-            pool = pools[(label, b)]
-            random.shuffle(pool)
-            selected.extend(pool[:tgt])
-
-    # build output
-    out = {rec["ad_id"]: {"v7": rec["v7"], "year": rec["year"]} for rec in selected}
-    OUT_PATH.write_text(json.dumps(out, ensure_ascii=False, indent=2), encoding="utf-8")
-
-    # summaries
-    pred_counts = Counter(rec["v7"] for rec in selected)
-    bucket_counts = Counter(bucket(rec["year"]) for rec in selected)
-    print(f"Saved {len(selected)} records to {OUT_PATH}")
+        key = (label, BUCKET_NAMES[bi])
+        reservoir = reservoirs[key]
+        n = seen[key]
+        seen[key] = n + 1
+        tgt = targets[key]
+        if n < tgt:
+            reservoir.append((ad_id, year))
+        else:
+            j = rngs[key].randrange(n + 1)
+            if j < tgt:
+                reservoir[j] = (ad_id, year)
+
+    # one pass per stratum: availability check, output (the label is the key)
+    # and summaries together
+    out: dict[str, dict] = {}
+    pred_counts = dict.fromkeys(PRED_BUCKET_TARGETS, 0)
+    bucket_counts = dict.fromkeys(BUCKET_NAMES, 0)
+    for label, b, tgt in _TARGETS:
+        avail = seen[(label, b)]
+        if avail < tgt:
+            raise SystemExit(f"Not enough candidates for {label} in {b}: need {tgt}, have {avail}")
+        out.update((ad_id, {"v7": label, "year": year}) for ad_id, year in reservoirs[(label, b)])
+        pred_counts[label] += tgt
+        bucket_counts[b] += tgt
+    OUT_PATH.write_bytes(_dumps(out))
+
+    print(f"Saved {len(out)} records to {OUT_PATH}")
     print("Pred counts:", pred_counts)
     print("Bucket counts:", bucket_counts)
 